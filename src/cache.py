@@ -0,0 +1,213 @@
+from __future__ import annotations
+
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Collection, Dict, List, Optional, Tuple
+
+from .config import Config
+from . import log
+from . import ms
+
+
+@dataclass(frozen=True)
+class MsEvent:
+    # событие вебхука МС: meta.type, action (CREATE/UPDATE/DELETE), meta.href
+    type: str
+    action: str
+    href: str
+
+
+def href_id(href: str) -> str:
+    return href.split("?", 1)[0].rstrip("/").rsplit("/", 1)[-1]
+
+
+def _href_key(href: str) -> str:
+    return href.split("?", 1)[0].rstrip("/")
+
+
+class _Registry:
+    """
+    id сущности -> ключи поиска (name, customerOrder id и т.п.).
+    Неполный по определению (только то, что пришло вебхуками): отсутствие ключа ничего не значит.
+    """
+
+    def __init__(self):
+        self._by_id: Dict[str, Tuple[float, Tuple[str, ...]]] = {}
+        self._index: Dict[str, str] = {}
+
+    def add(self, entity_id: str, *keys: str) -> None:
+        self.remove(entity_id)
+        self._by_id[entity_id] = (time.time(), keys)
+        for k in keys:
+            self._index[k] = entity_id
+
+    def remove(self, entity_id: str) -> None:
+        item = self._by_id.pop(entity_id, None)
+        if not item:
+            return
+        for k in item[1]:
+            if self._index.get(k) == entity_id:
+                del self._index[k]
+
+    def prune(self, max_age_s: float) -> None:
+        cutoff = time.time() - max_age_s
+        for entity_id in [i for i, (ts, _) in self._by_id.items() if ts < cutoff]:
+            self.remove(entity_id)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._index
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def keys(self) -> List[str]:
+        return sorted(self._index)
+
+
+class MsCache:
+    """
+    Кеш МС между тиками, который поддерживается вебхуками:
+      - article -> positions (инвалидация по product/variant/service/bundle событиям, TTL как страховка);
+      - реестр customerorder по name (антидубль при создании заказа);
+      - реестр demand по name и по customerOrder (антидубль при создании отгрузки).
+    Реестры нужны только для объектов, созданных в МС не нами: на свои CREATE-события GET не делаем.
+    События кладёт поток вебхука (push), применяются в начале тика в основном потоке (apply_pending).
+    """
+
+    def __init__(self, positions_ttl_s: float, registry_ttl_s: float):
+        self.positions_ttl_s = positions_ttl_s
+        self.registry_ttl_s = registry_ttl_s
+
+        self._lock = threading.Lock()
+        self._pending: List[MsEvent] = []
+
+        # (article, qty) -> (savedAt, positions, hrefs ассортимента)
+        self._positions: Dict[Tuple[str, float], Tuple[float, List[Dict[str, Any]], Tuple[str, ...]]] = {}
+        self._orders = _Registry()
+        self._demands = _Registry()
+        # id customerorder/demand, созданных этим сервисом (ещё не пришло их CREATE-событие)
+        self._own: Dict[str, float] = {}
+
+    # --- webhook side (любой поток)
+
+    def push(self, events: List[MsEvent]) -> None:
+        with self._lock:
+            self._pending.extend(events)
+
+    # --- sync side (основной поток)
+
+    def mark_own(self, entity_id: str) -> None:
+        self._own[entity_id] = time.time()
+
+    def apply_pending(
+        self,
+        cfg: Config,
+        known_ids: Collection[str] = (),
+        fetch: Optional[Callable[[str, str], Dict[str, Any]]] = None,
+    ) -> None:
+        """
+        known_ids — id наших customerorder (msOrderId из state.active): их CREATE-события пропускаем.
+        fetch(href, token) — чем читать сущность из МС (по умолчанию ms.ms_get_json; для офлайн-проверки — заглушка).
+        """
+        fetch = fetch or ms.ms_get_json
+        with self._lock:
+            events, self._pending = self._pending, []
+        if not events:
+            return
+
+        log.info(f"Webhook events: {len(events)}")
+        for ev in events:
+            try:
+                self._apply(cfg, ev, known_ids, fetch)
+            except Exception as e:
+                # событие потеряли — не страшно, антидубли всё равно проверяются запросами в МС
+                log.warn(f"Webhook event {ev.type} {ev.action} {ev.href} failed: {e}")
+
+        self._orders.prune(self.registry_ttl_s)
+        self._demands.prune(self.registry_ttl_s)
+        cutoff = time.time() - self.registry_ttl_s
+        for entity_id in [i for i, ts in self._own.items() if ts < cutoff]:
+            del self._own[entity_id]
+
+    def _apply(
+        self,
+        cfg: Config,
+        ev: MsEvent,
+        known_ids: Collection[str],
+        fetch: Callable[[str, str], Dict[str, Any]],
+    ) -> None:
+        # по href ходим с токеном МС -> только свой MS_BASE
+        if not ev.href.startswith(f"{cfg.MS_BASE}/entity/{ev.type}/"):
+            log.warn(f"Webhook event with foreign href ignored: {ev.type} {ev.href[:200]}")
+            return
+
+        if ev.type == "bundle":
+            # состав комплекта мог поменяться — проще сбросить всё
+            self._positions.clear()
+            return
+
+        if ev.type in ("product", "variant", "service"):
+            # компоненты комплекта бывают не только product: цену берём по href любого ассортимента
+            if ev.action in ("UPDATE", "DELETE"):
+                self._drop_positions_with(ev.href)
+            return
+
+        if ev.type == "customerorder":
+            entity_id = href_id(ev.href)
+            if ev.action == "DELETE":
+                self._orders.remove(entity_id)
+                return
+            if ev.action == "CREATE":
+                if self._own.pop(entity_id, None) is not None or entity_id in known_ids:
+                    return
+                co = fetch(ev.href, cfg.MS_TOKEN)
+                self._orders.add(entity_id, f"name:{co.get('name', '')}")
+            return
+
+        if ev.type == "demand":
+            entity_id = href_id(ev.href)
+            if ev.action == "DELETE":
+                self._demands.remove(entity_id)
+                return
+            if ev.action == "CREATE":
+                if self._own.pop(entity_id, None) is not None:
+                    return
+                d = fetch(ev.href, cfg.MS_TOKEN)
+                keys = [f"name:{d.get('name', '')}"]
+                co_href = ((d.get("customerOrder") or {}).get("meta") or {}).get("href")
+                if co_href:
+                    keys.append(f"order:{href_id(co_href)}")
+                self._demands.add(entity_id, *keys)
+
+    def _drop_positions_with(self, href: str) -> None:
+        key = _href_key(href)
+        for k in [k for k, (_, _, hrefs) in self._positions.items() if key in hrefs]:
+            del self._positions[k]
+
+    def get_positions(self, article: str, qty: float) -> Optional[List[Dict[str, Any]]]:
+        item = self._positions.get((article, qty))
+        if item is None:
+            return None
+        saved_at, positions, _ = item
+        if time.time() - saved_at > self.positions_ttl_s:
+            del self._positions[(article, qty)]
+            return None
+        return positions
+
+    def put_positions(self, article: str, qty: float, positions: List[Dict[str, Any]]) -> None:
+        hrefs = tuple(_href_key(p["assortment"]["meta"]["href"]) for p in positions)
+        self._positions[(article, qty)] = (time.time(), positions, hrefs)
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "positions": len(self._positions),
+            "orders": self._orders.keys(),
+            "demands": self._demands.keys(),
+        }
+
+    def has_order(self, name: str) -> bool:
+        return f"name:{name}" in self._orders
+
+    def has_demand(self, name: str, customerorder_id: str) -> bool:
+        return f"name:{name}" in self._demands or f"order:{customerorder_id}" in self._demands
@@ -43,3 +43,22 @@ class Config:
 
     # absolute state path (../data/state.json from src/)
     STATE_PATH: str = str((Path(__file__).resolve().parent.parent / "data" / "state.json").resolve())
+
+    # profiling / slow-tick trace (dumps -> ../data/profiles)
+    PROFILE_DIR: str = str((Path(__file__).resolve().parent.parent / "data" / "profiles").resolve())
+    # создать файл (опционально с числом тиков внутри) или послать SIGUSR1 -> cProfile следующих тиков
+    PROFILE_CONTROL_FILE: str = str((Path(__file__).resolve().parent.parent / "data" / "profile.request").resolve())
+    PROFILE_TICKS: int = 3
+    # тик дольше порога -> пишем таймлайн запросов/фаз (0 = выключено)
+    SLOW_TICK_SECONDS: float = 120.0
+
+    # MS webhooks (product/bundle/customerorder/demand) -> кеш позиций и реестры антидублей
+    # вебхуки в МС регистрируются отдельно, url: http://<host>:<port><path>?key=<key>
+    # WEBHOOK_KEY обязателен; наружу (0.0.0.0) открывать только осознанно
+    WEBHOOK_ENABLED: bool = False
+    WEBHOOK_HOST: str = "127.0.0.1"
+    WEBHOOK_PORT: int = 8085
+    WEBHOOK_PATH: str = "/ms-webhook"
+    WEBHOOK_KEY: str = ""
+    # страховка на случай потерянных событий
+    CATALOG_CACHE_TTL_SECONDS: int = 3600
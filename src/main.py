@@ -5,6 +5,10 @@ from datetime import datetime
 
 from .config import Config
 from . import log
+from . import ms
+from . import trace
+from . import webhook
+from .cache import MsCache
 from .state import load_state, save_state
 from .sync import sync_once
 
@@ -16,15 +20,31 @@ def main() -> None:
     log.info(f"STATE_PATH={cfg.STATE_PATH}")
     log.info(f"Loaded state: active={len(state.active)} forgotten={len(state.forgotten)}")
 
+    profiler = trace.Profiler(cfg.PROFILE_DIR, cfg.PROFILE_TICKS, cfg.PROFILE_CONTROL_FILE)
+    profiler.install_signal()
+
+    cache = None
+    if cfg.WEBHOOK_ENABLED:
+        cache = MsCache(cfg.CATALOG_CACHE_TTL_SECONDS, cfg.SYNC_DAYS * 86400)
+        webhook.start_listener(cfg, cache)
+
     while True:
         t0 = time.time()
         log.info(f"Tick: active={len(state.active)} forgotten={len(state.forgotten)}")
+        profiler.before_tick()
+        trace.begin_tick()
         try:
-            sync_once(cfg, state)
-            save_state(cfg.STATE_PATH, state)
+            with trace.span("sync_once"), ms.tick_scope():
+                sync_once(cfg, state, cache)
+            with trace.span("save_state"):
+                save_state(cfg.STATE_PATH, state)
         except Exception as e:
             log.error(f"Loop error: {e}")
         dt = time.time() - t0
+        trace_path = trace.end_tick(cfg.PROFILE_DIR, cfg.SLOW_TICK_SECONDS, dt)
+        if trace_path:
+            log.warn(f"Slow tick {dt:.2f}s -> trace {trace_path}")
+        profiler.after_tick()
         log.info(f"Tick done in {dt:.2f}s, sleep {cfg.POLL_SECONDS}s")
         time.sleep(cfg.POLL_SECONDS)
 
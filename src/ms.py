@@ -1,10 +1,13 @@
 from __future__ import annotations
 
+import threading
 import time
 import requests
-from typing import Any, Dict, List, Optional
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
 
 from . import log
+from . import trace
 
 
 class MsHttpError(RuntimeError):
@@ -44,11 +47,26 @@ def request_ms(
     json_body=None,
     timeout: int = 40,
     max_tries: int = 6,
+) -> requests.Response:
+    with trace.span("ms.request", cat="ms", method=method, url=url) as targs:
+        return _request_ms(method, url, token, targs, json_body=json_body, timeout=timeout, max_tries=max_tries)
+
+
+def _request_ms(
+    method: str,
+    url: str,
+    token: str,
+    targs: Dict[str, Any],
+    *,
+    json_body,
+    timeout: int,
+    max_tries: int,
 ) -> requests.Response:
     h = ms_headers(token)
 
     last_exc: Exception | None = None
     for attempt in range(1, max_tries + 1):
+        targs["attempts"] = attempt
         try:
             r = requests.request(method, url, headers=h, json=json_body, timeout=timeout)
 
@@ -63,6 +81,7 @@ def request_ms(
                 time.sleep(sleep_s)
                 continue
 
+            targs["status"] = r.status_code
             return r
         except requests.RequestException as e:
             last_exc = e
@@ -75,7 +94,119 @@ def request_ms(
     raise MsHttpError(f"MS request failed after retries: {method} {url}. Last error: {last_exc}")
 
 
+class _Flight:
+    def __init__(self, gen: int):
+        self.gen = gen
+        self.done = threading.Event()
+        self.result: Optional[Dict[str, Any]] = None
+        self.exc: Optional[BaseException] = None
+
+
+# Single-flight для GET в пределах тика:
+#   - одинаковые URL, запрошенные параллельно, ждут один HTTP запрос;
+#   - успешный ответ переиспользуется до конца тика (ошибки не кешируются);
+#   - POST/PUT сбрасывают закешированные и ещё летящие URL этой сущности
+#     (+ связанных: запись demand меняет ответы customerorder, см. _RELATED);
+# Вне tick_scope() — обычные запросы без кеша.
+# Ответы общие для всех вызывающих — не мутировать.
+_sf_lock = threading.Lock()
+_sf_cache: Optional[Dict[str, Dict[str, Any]]] = None
+_sf_inflight: Dict[str, _Flight] = {}
+_sf_gen = 0
+_sf_hits = 0
+
+
+@contextmanager
+def tick_scope() -> Iterator[None]:
+    global _sf_cache, _sf_hits
+    with _sf_lock:
+        _sf_cache = {}
+        _sf_hits = 0
+    try:
+        yield
+    finally:
+        with _sf_lock:
+            size, hits = len(_sf_cache or {}), _sf_hits
+            _sf_cache = None
+        if hits:
+            log.info(f"MS GET coalesced: {hits} hit(s), {size} unique")
+
+
+# запись в сущность -> какие ещё сущности перечитать (has_linked_demand смотрит demands у заказа)
+_RELATED: Dict[str, tuple] = {"demand": ("customerorder",)}
+
+
+def _invalidate(url: str) -> None:
+    global _sf_gen
+    base = url.split("?", 1)[0].rstrip("/")
+    bases = [base]
+    root, sep, rest = base.partition("/entity/")
+    if sep:
+        for entity in _RELATED.get(rest.split("/", 1)[0], ()):
+            bases.append(f"{root}/entity/{entity}")
+
+    def hit(k: str) -> bool:
+        return any(k == b or k.startswith(b + "/") or k.startswith(b + "?") for b in bases)
+
+    with _sf_lock:
+        _sf_gen += 1
+        # летящий GET мог уйти до записи: новые вызывающие должны сделать свой запрос
+        # (уже ждущие получат старый ответ — они спросили до записи)
+        for k in [k for k in _sf_inflight if hit(k)]:
+            del _sf_inflight[k]
+        if not _sf_cache:
+            return
+        for k in [k for k in _sf_cache if hit(k)]:
+            del _sf_cache[k]
+
+
 def ms_get_json(url: str, token: str) -> Dict[str, Any]:
+    global _sf_hits
+    with _sf_lock:
+        if _sf_cache is None:
+            flight = None
+        else:
+            hit = _sf_cache.get(url)
+            if hit is not None:
+                _sf_hits += 1
+                return hit
+            flight = _sf_inflight.get(url)
+            owner = flight is None
+            if owner:
+                flight = _Flight(_sf_gen)
+                _sf_inflight[url] = flight
+            else:
+                _sf_hits += 1
+
+    if flight is None:
+        return _ms_get_json(url, token)
+
+    if not owner:
+        flight.done.wait()
+        if flight.exc is not None:
+            raise flight.exc
+        return flight.result
+
+    try:
+        data = _ms_get_json(url, token)
+        flight.result = data
+        with _sf_lock:
+            # за время запроса могла пройти запись -> такой ответ не кешируем
+            if _sf_cache is not None and flight.gen == _sf_gen:
+                _sf_cache[url] = data
+        return data
+    except BaseException as e:
+        flight.exc = e
+        raise
+    finally:
+        with _sf_lock:
+            # после _invalidate по этому URL мог стартовать новый flight — его не трогаем
+            if _sf_inflight.get(url) is flight:
+                del _sf_inflight[url]
+        flight.done.set()
+
+
+def _ms_get_json(url: str, token: str) -> Dict[str, Any]:
     r = request_ms("GET", url, token)
     _raise_for_status_with_body(r, f"GET {url}")
     try:
@@ -85,8 +216,12 @@ def ms_get_json(url: str, token: str) -> Dict[str, Any]:
 
 
 def ms_post_json(url: str, token: str, body: Dict[str, Any]) -> Dict[str, Any]:
-    r = request_ms("POST", url, token, json_body=body)
-    _raise_for_status_with_body(r, f"POST {url}")
+    try:
+        r = request_ms("POST", url, token, json_body=body)
+        _raise_for_status_with_body(r, f"POST {url}")
+    finally:
+        # запись могла пройти даже при 5xx / сетевой ошибке -> кеш сущности сбрасываем всегда
+        _invalidate(url)
     try:
         return r.json()
     except Exception as e:
@@ -94,8 +229,12 @@ def ms_post_json(url: str, token: str, body: Dict[str, Any]) -> Dict[str, Any]:
 
 
 def ms_put_json(url: str, token: str, body: Dict[str, Any]) -> Dict[str, Any]:
-    r = request_ms("PUT", url, token, json_body=body)
-    _raise_for_status_with_body(r, f"PUT {url}")
+    try:
+        r = request_ms("PUT", url, token, json_body=body)
+        _raise_for_status_with_body(r, f"PUT {url}")
+    finally:
+        # запись могла пройти даже при 5xx / сетевой ошибке -> кеш сущности сбрасываем всегда
+        _invalidate(url)
     try:
         return r.json()
     except Exception as e:
@@ -3,11 +3,13 @@ from __future__ import annotations
 from datetime import datetime, timezone, timedelta
 from typing import Any, Dict, List, Optional, Tuple
 
+from .cache import MsCache
 from .config import Config
 from . import log
 from .state import State, remember, forget_forever, forget_active, is_forgotten
 from . import wb
 from . import ms
+from . import trace
 
 
 def to_unix(dt: datetime) -> int:
@@ -49,11 +51,26 @@ def map_wb_to_ms_state(cfg: Config, supplier: str, wb_status: str) -> Optional[s
     return None
 
 
-def expand_article_to_positions(cfg: Config, article: str, qty: float) -> Tuple[bool, str, List[Dict[str, Any]]]:
+def expand_article_to_positions(
+    cfg: Config, article: str, qty: float, cache: Optional[MsCache] = None
+) -> Tuple[bool, str, List[Dict[str, Any]]]:
     """
     Возвращает (ok, err, positions) для CustomerOrder (с reserve).
     Правило: если не найден товар/цена/компонент -> ok=False.
+    С cache успешный результат переиспользуется между тиками (ошибки не кешируются).
     """
+    if cache is not None:
+        hit = cache.get_positions(article, qty)
+        if hit is not None:
+            return True, "", hit
+
+    ok, err, positions = _expand_article_to_positions(cfg, article, qty)
+    if ok and cache is not None:
+        cache.put_positions(article, qty, positions)
+    return ok, err, positions
+
+
+def _expand_article_to_positions(cfg: Config, article: str, qty: float) -> Tuple[bool, str, List[Dict[str, Any]]]:
     # 1) bundle?
     b = ms.find_bundle_by_article(cfg.MS_BASE, cfg.MS_TOKEN, article)
     if b:
@@ -151,24 +168,17 @@ def create_customerorder(cfg: Config, wb_id: str, positions: List[Dict[str, Any]
     return ms.ms_post_json(url, cfg.MS_TOKEN, build_customerorder_body(cfg, wb_id, positions))
 
 
-def create_demand(cfg: Config, wb_id: str, positions_no_reserve: List[Dict[str, Any]]) -> None:
+def create_demand(cfg: Config, wb_id: str, positions_no_reserve: List[Dict[str, Any]]) -> Dict[str, Any]:
     url = f"{cfg.MS_BASE}/entity/demand"
-    ms.ms_post_json(url, cfg.MS_TOKEN, build_demand_body(cfg, wb_id, positions_no_reserve))
+    return ms.ms_post_json(url, cfg.MS_TOKEN, build_demand_body(cfg, wb_id, positions_no_reserve))
 
 
 def is_terminal(supplier: str, wb_status: str) -> bool:
     return (wb_status in ("sold", "canceled_by_client", "declined_by_client", "defect", "canceled")) or (supplier == "cancel")
 
 
-def sync_once(cfg: Config, state: State) -> None:
-    frm, to = get_window(cfg)
-    date_from = to_unix(frm)
-    date_to = to_unix(to)
-
-    # 1) WB orders window
-    orders = wb.get_orders(cfg.WB_TOKEN, date_from, date_to)
-
-    # 2) Create CustomerOrder (только если не active и не forgotten, и если не существует в МС по name)
+def create_new_orders(cfg: Config, state: State, orders: List[Dict[str, Any]], cache: Optional[MsCache] = None) -> None:
+    # Create CustomerOrder (только если не active и не forgotten, и если не существует в МС по name)
     for o in orders:
         wb_id = str(o["id"])
 
@@ -178,6 +188,9 @@ def sync_once(cfg: Config, state: State) -> None:
             continue
 
         # если CustomerOrder уже есть -> забываем навсегда
+        if cache is not None and cache.has_order(wb_id):
+            forget_forever(state, wb_id)
+            continue
         existing = ms.find_one_by_name(cfg.MS_BASE, cfg.MS_TOKEN, "customerorder", wb_id)
         if existing:
             forget_forever(state, wb_id)
@@ -190,7 +203,7 @@ def sync_once(cfg: Config, state: State) -> None:
             forget_forever(state, wb_id)
             continue
 
-        ok, err, positions = expand_article_to_positions(cfg, article, 1.0)
+        ok, err, positions = expand_article_to_positions(cfg, article, 1.0, cache)
         if not ok:
             log.warn(f"WB {wb_id} skip (positions): {err} -> forget forever")
             forget_forever(state, wb_id)
@@ -199,12 +212,16 @@ def sync_once(cfg: Config, state: State) -> None:
         try:
             co = create_customerorder(cfg, wb_id, positions)
             remember(state, wb_id, ms_order_id=co["id"], ms_order_href=co["meta"]["href"])
+            if cache is not None:
+                cache.mark_own(co["id"])
             log.info(f"Created CustomerOrder name={wb_id}")
         except Exception as e:
             log.error(f"Create CustomerOrder failed wbId={wb_id}: {e} -> forget forever")
             forget_forever(state, wb_id)
 
-    # 3) Track statuses only for active
+
+def track_active(cfg: Config, state: State, cache: Optional[MsCache] = None) -> None:
+    # Track statuses only for active
     active_ids = list(state.active.keys())
     if not active_ids:
         return
@@ -244,6 +261,11 @@ def sync_once(cfg: Config, state: State) -> None:
             # trigger demand: complete+sorted
             if supplier == "complete" and wb_status == "sorted":
                 try:
+                    # антидубль: Demand из вебхуков (по name или по заказу)
+                    if cache is not None and cache.has_demand(wb_id, co_id):
+                        forget_forever(state, wb_id)
+                        continue
+
                     # антидубль: Demand по name
                     d = ms.find_one_by_name(cfg.MS_BASE, cfg.MS_TOKEN, "demand", wb_id)
                     if d:
@@ -270,7 +292,9 @@ def sync_once(cfg: Config, state: State) -> None:
                             }
                         )
 
-                    create_demand(cfg, wb_id, dpos)
+                    d = create_demand(cfg, wb_id, dpos)
+                    if cache is not None:
+                        cache.mark_own(d["id"])
                     log.info(f"Created Demand name={wb_id}")
                 except Exception as e:
                     log.error(f"Demand flow failed wbId={wb_id}: {e} -> forget forever")
@@ -287,3 +311,27 @@ def sync_once(cfg: Config, state: State) -> None:
                 except Exception as e:
                     # временные ошибки МС не валят цикл
                     log.warn(f"MS state update failed wbId={wb_id}: {e}")
+
+
+def sync_once(cfg: Config, state: State, cache: Optional[MsCache] = None) -> None:
+    frm, to = get_window(cfg)
+    date_from = to_unix(frm)
+    date_to = to_unix(to)
+
+    # 0) накопленные события вебхуков -> кеш/реестры
+    if cache is not None:
+        with trace.span("sync.webhook_events"):
+            known_ids = {m.get("msOrderId") for m in state.active.values()}
+            cache.apply_pending(cfg, known_ids)
+
+    # 1) WB orders window
+    with trace.span("sync.wb_orders"):
+        orders = wb.get_orders(cfg.WB_TOKEN, date_from, date_to)
+
+    # 2) новые заказы -> CustomerOrder
+    with trace.span("sync.create_orders", orders=len(orders)):
+        create_new_orders(cfg, state, orders, cache)
+
+    # 3) статусы active
+    with trace.span("sync.track_active", active=len(state.active)):
+        track_active(cfg, state, cache)
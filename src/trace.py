@@ -0,0 +1,155 @@
+from __future__ import annotations
+
+import cProfile
+import json
+import os
+import signal
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+from . import log
+
+# Таймлайн текущего тика: пишем всегда (дёшево), на диск — только если тик медленный.
+# Формат — Chrome Trace Event (открывается в chrome://tracing, Perfetto, speedscope).
+_lock = threading.Lock()
+_events: Optional[List[Dict[str, Any]]] = None
+_t0: float = 0.0
+
+
+def _stamp() -> str:
+    return datetime.now().strftime("%Y%m%d-%H%M%S")
+
+
+def begin_tick() -> None:
+    global _events, _t0
+    with _lock:
+        _events = []
+        _t0 = time.perf_counter()
+
+
+def end_tick(out_dir: str, threshold_s: float, elapsed_s: float) -> Optional[str]:
+    """
+    Закрывает таймлайн тика. Если тик дольше threshold_s — сохраняет trace и возвращает путь.
+    """
+    global _events
+    with _lock:
+        events, _events = _events, None
+
+    if events is None or threshold_s <= 0 or elapsed_s < threshold_s:
+        return None
+
+    p = Path(out_dir) / f"slow-tick-{_stamp()}.trace.json"
+    try:
+        p.parent.mkdir(parents=True, exist_ok=True)
+        p.write_text(
+            json.dumps({"traceEvents": events, "displayTimeUnit": "ms"}, ensure_ascii=False),
+            encoding="utf-8",
+        )
+    except Exception as e:
+        log.warn(f"Slow tick trace dump failed: {e}")
+        return None
+    return str(p)
+
+
+@contextmanager
+def span(name: str, cat: str = "sync", **args: Any) -> Iterator[Dict[str, Any]]:
+    """
+    Отрезок таймлайна. В args можно дописать результат внутри блока (например, HTTP статус).
+    Вне тика — no-op.
+    """
+    if _events is None:
+        yield args
+        return
+
+    start = time.perf_counter()
+    try:
+        yield args
+    finally:
+        end = time.perf_counter()
+        ev = {
+            "name": name,
+            "cat": cat,
+            "ph": "X",
+            "ts": round((start - _t0) * 1e6),
+            "dur": round((end - start) * 1e6),
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "args": args,
+        }
+        with _lock:
+            if _events is not None:
+                _events.append(ev)
+
+
+class Profiler:
+    """
+    cProfile следующих N тиков по запросу.
+    Триггеры: SIGUSR1 (где есть) или control-файл (в нём можно указать N).
+    Результат — .prof (pstats), открывается snakeviz / `python -m pstats`.
+    """
+
+    def __init__(self, out_dir: str, ticks: int, control_file: str):
+        self.out_dir = out_dir
+        self.ticks = ticks
+        self.control_file = control_file
+        self._pending = 0
+        self._remaining = 0
+        self._prof: Optional[cProfile.Profile] = None
+
+    def install_signal(self) -> None:
+        sig = getattr(signal, "SIGUSR1", None)
+        if sig is None:
+            return
+        signal.signal(sig, self._on_signal)
+
+    def _on_signal(self, signum, frame) -> None:
+        self._pending = self.ticks
+
+    def _check_control_file(self) -> None:
+        p = Path(self.control_file)
+        if not p.exists():
+            return
+        try:
+            raw = p.read_text(encoding="utf-8").strip()
+            p.unlink()
+        except Exception as e:
+            log.warn(f"Profile control file read failed: {e}")
+            return
+        self._pending = int(raw) if raw.isdigit() and int(raw) > 0 else self.ticks
+
+    def before_tick(self) -> None:
+        self._check_control_file()
+        if self._prof is None and self._pending > 0:
+            self._remaining, self._pending = self._pending, 0
+            self._prof = cProfile.Profile()
+            log.info(f"Profiling next {self._remaining} tick(s)")
+
+        if self._prof is not None:
+            try:
+                self._prof.enable()
+            except ValueError as e:
+                # уже работает другой профайлер (например, запущены под py-spy/cProfile снаружи)
+                log.warn(f"Profiler enable failed: {e}")
+                self._prof = None
+                self._remaining = 0
+
+    def after_tick(self) -> None:
+        if self._prof is None:
+            return
+        self._prof.disable()
+        self._remaining -= 1
+        if self._remaining > 0:
+            return
+
+        prof, self._prof = self._prof, None
+        p = Path(self.out_dir) / f"profile-{_stamp()}.prof"
+        try:
+            p.parent.mkdir(parents=True, exist_ok=True)
+            prof.dump_stats(str(p))
+            log.info(f"Profile saved: {p}")
+        except Exception as e:
+            log.warn(f"Profile dump failed: {e}")
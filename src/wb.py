@@ -2,6 +2,8 @@ from __future__ import annotations
 import requests
 from typing import Any, Dict, List
 
+from . import trace
+
 WB_BASE = "https://marketplace-api.wildberries.ru/api/v3"
 
 def _headers(token: str) -> Dict[str, str]:
@@ -13,7 +15,9 @@ def get_orders(token: str, date_from: int, date_to: int, limit: int = 1000) -> L
     while True:
         url = f"{WB_BASE}/orders"
         params = {"limit": limit, "next": next_val, "dateFrom": date_from, "dateTo": date_to}
-        r = requests.get(url, headers=_headers(token), params=params, timeout=30)
+        with trace.span("wb.orders", cat="wb", next=next_val) as targs:
+            r = requests.get(url, headers=_headers(token), params=params, timeout=30)
+            targs["status"] = r.status_code
         r.raise_for_status()
         data = r.json()
         batch = data.get("orders") or []
@@ -27,7 +31,9 @@ def get_statuses(token: str, order_ids: List[int]) -> List[Dict[str, Any]]:
     if not order_ids:
         return []
     url = f"{WB_BASE}/orders/status"
-    r = requests.post(url, headers=_headers(token), json={"orders": order_ids}, timeout=30)
+    with trace.span("wb.orders.status", cat="wb", orders=len(order_ids)) as targs:
+        r = requests.post(url, headers=_headers(token), json={"orders": order_ids}, timeout=30)
+        targs["status"] = r.status_code
     r.raise_for_status()
     data = r.json()
     return data.get("orders") or []
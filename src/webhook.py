@@ -0,0 +1,147 @@
+from __future__ import annotations
+
+import hmac
+import json
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qs, urlsplit
+
+import requests
+
+from .cache import MsCache, MsEvent
+from .config import Config
+from . import log
+from . import ms
+
+# какие события МС нас интересуют (остальные молча игнорируем)
+EVENT_TYPES = ("product", "variant", "service", "bundle", "customerorder", "demand")
+
+
+def parse_payload(cfg: Config, raw: bytes) -> List[MsEvent]:
+    """
+    Тело вебхука МС: {"events": [{"meta": {"type", "href"}, "action", ...}, ...]}.
+    Кидает ValueError, если это не JSON / не тот формат.
+    События с href не на {MS_BASE}/entity/{type}/ отбрасываются: по href потом ходим с токеном МС.
+    """
+    obj: Any = json.loads(raw.decode("utf-8"))
+    if not isinstance(obj, dict) or not isinstance(obj.get("events"), list):
+        raise ValueError("no events[] in payload")
+
+    events: List[MsEvent] = []
+    for e in obj["events"]:
+        if not isinstance(e, dict):
+            continue
+        meta = e.get("meta") or {}
+        typ = meta.get("type") or ""
+        href = meta.get("href") or ""
+        action = e.get("action") or ""
+        if typ not in EVENT_TYPES or not action:
+            continue
+        if not href.startswith(f"{cfg.MS_BASE}/entity/{typ}/"):
+            log.warn(f"Webhook event with foreign href ignored: {typ} {href[:200]}")
+            continue
+        events.append(MsEvent(type=typ, action=action, href=href))
+    return events
+
+
+def _make_handler(cfg: Config, cache: MsCache):
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self) -> None:
+            u = urlsplit(self.path)
+            if u.path != cfg.WEBHOOK_PATH:
+                self._reply(404)
+                return
+            key = parse_qs(u.query).get("key", [""])[0]
+            if not hmac.compare_digest(key.encode("utf-8"), cfg.WEBHOOK_KEY.encode("utf-8")):
+                self._reply(403)
+                return
+
+            try:
+                length = int(self.headers.get("Content-Length") or 0)
+                raw = self.rfile.read(length) if length > 0 else b""
+                events = parse_payload(cfg, raw)
+            except Exception as e:
+                log.warn(f"Webhook bad payload: {e}")
+                self._reply(400)
+                return
+
+            cache.push(events)
+            self._reply(200)
+
+        def _reply(self, code: int) -> None:
+            self.send_response(code)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def log_message(self, format, *args) -> None:
+            # стандартный access log BaseHTTPRequestHandler пишет в stderr на каждый запрос
+            pass
+
+    return Handler
+
+
+def start_listener(cfg: Config, cache: MsCache) -> ThreadingHTTPServer:
+    if not cfg.WEBHOOK_KEY:
+        # без ключа любой, кто достучится до порта, может наполнить реестры антидублей
+        raise RuntimeError("WEBHOOK_ENABLED requires WEBHOOK_KEY")
+    server = ThreadingHTTPServer((cfg.WEBHOOK_HOST, cfg.WEBHOOK_PORT), _make_handler(cfg, cache))
+    t = threading.Thread(target=server.serve_forever, name="ms-webhook", daemon=True)
+    t.start()
+    log.info(f"Webhook listener on {cfg.WEBHOOK_HOST}:{cfg.WEBHOOK_PORT}{cfg.WEBHOOK_PATH}")
+    return server
+
+
+def replay(path: str, url: str) -> int:
+    """
+    Отправить сохранённое тело вебхука в локальный listener:
+        python -m src.webhook payload.json [url]
+    """
+    raw = Path(path).read_bytes()
+    parse_payload(Config(), raw)  # сразу видно, если файл битый
+    r = requests.post(url, data=raw, headers={"Content-Type": "application/json"}, timeout=10)
+    print(f"{url} -> HTTP {r.status_code}")
+    return 0 if 200 <= r.status_code < 300 else 1
+
+
+def check(path: str, entities_path: Optional[str] = None) -> int:
+    """
+    Офлайн-проверка сохранённого тела вебхука без listener и без МС:
+        python -m src.webhook --check payload.json [entities.json]
+    parse_payload -> MsCache.push -> apply_pending; entities.json — {href: тело сущности, как вернул бы GET}.
+    """
+    cfg = Config()
+    events = parse_payload(cfg, Path(path).read_bytes())
+    for ev in events:
+        print(f"{ev.type} {ev.action} {ev.href}")
+
+    entities: Dict[str, Any] = {}
+    if entities_path:
+        entities = json.loads(Path(entities_path).read_text(encoding="utf-8"))
+
+    def fetch(href: str, token: str) -> Dict[str, Any]:
+        if href not in entities:
+            raise ms.MsHttpError(f"no entity for {href} in {entities_path}", status_code=404)
+        return entities[href]
+
+    cache = MsCache(cfg.CATALOG_CACHE_TTL_SECONDS, cfg.SYNC_DAYS * 86400)
+    cache.push(events)
+    cache.apply_pending(cfg, fetch=fetch)
+    print(json.dumps(cache.summary(), ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or (sys.argv[1] == "--check" and len(sys.argv) < 3):
+        print("usage: python -m src.webhook <payload.json> [url]", file=sys.stderr)
+        print("       python -m src.webhook --check <payload.json> [entities.json]", file=sys.stderr)
+        sys.exit(2)
+    if sys.argv[1] == "--check":
+        sys.exit(check(sys.argv[2], sys.argv[3] if len(sys.argv) > 3 else None))
+    _cfg = Config()
+    _url = sys.argv[2] if len(sys.argv) > 2 else f"http://127.0.0.1:{_cfg.WEBHOOK_PORT}{_cfg.WEBHOOK_PATH}"
+    if _cfg.WEBHOOK_KEY and "key=" not in _url:
+        _url += ("&" if "?" in _url else "?") + f"key={_cfg.WEBHOOK_KEY}"
+    sys.exit(replay(sys.argv[1], _url))